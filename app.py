@@ -1,18 +1,108 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from flask_compress import Compress
+from werkzeug.security import generate_password_hash, check_password_hash
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-import joblib, os, requests
-from datetime import datetime, timedelta
-from functools import wraps
+import numpy as np
+import bisect
+import orjson
+import joblib, os, re, requests
+from datetime import date, datetime, timedelta
+from functools import wraps, lru_cache
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import hmac
+import logging
+import pickle
+import queue
 import signal
 import sys
+import tempfile
+import threading
+import unicodedata
 import config
 from firebase_init import init_firebase
 from firebase_admin import firestore
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider dùng orjson cho jsonify (hỗ trợ sẵn datetime và kiểu numpy)"""
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, option=self.option, default=self.default)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = config.SECRET_KEY
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
 
+# Nén response (ưu tiên Brotli, fallback gzip) cho HTML và JSON
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+
+# =========================================================
+#               LOGGING
+# =========================================================
+
+# Request thread chỉ đẩy log vào queue, việc format và ghi ra file/stdout do QueueListener đảm nhận
+LOG_FILE = getattr(config, "LOG_FILE", None)
+if LOG_FILE:
+    _log_handler = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+else:
+    _log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+_log_queue_handler = QueueHandler(queue.Queue(-1))
+_log_listener = None
+
+def _start_log_listener():
+    """
+    Tạo queue và thread QueueListener cho process hiện tại.
+    Thread không sống sót qua fork(), nên worker con (gunicorn preload) phải tự khởi động lại.
+    """
+    global _log_listener
+    _log_queue_handler.queue = queue.Queue(-1)
+    _log_listener = QueueListener(_log_queue_handler.queue, _log_handler)
+    _log_listener.start()
+
+def _stop_log_listener():
+    if _log_listener is not None:
+        _log_listener.stop()
+
+_start_log_listener()
+os.register_at_fork(after_in_child=_start_log_listener)
+atexit.register(_stop_log_listener)
+
+log = logging.getLogger("qlmv")
+log.setLevel(getattr(config, "LOG_LEVEL", logging.INFO))
+log.addHandler(_log_queue_handler)
+log.propagate = False
+
 # =========================================================
 #               ERROR HANDLERS & TIMEOUT
 # =========================================================
@@ -23,47 +113,82 @@ def not_found_error(error):
 
 @app.errorhandler(500)
 def internal_error(error):
-    print(f"Internal Server Error: {error}")
+    log.error("Internal Server Error: %s", error)
     return render_template('500.html'), 500
 
 @app.errorhandler(Exception)
 def handle_exception(error):
-    print(f"Unhandled Exception: {error}")
+    log.error("Unhandled Exception: %s", error, exc_info=error)
     flash("Đã xảy ra lỗi hệ thống. Vui lòng thử lại.", "danger")
     return redirect(url_for('index'))
 
+# Các endpoint xác thực / ghi dữ liệu không bao giờ được cache
+NO_STORE_ENDPOINTS = {"login", "register", "logout"}
+
 @app.after_request
 def after_request(response):
-    """Thêm headers để tránh caching issues"""
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    """
+    Chỉ cho trình duyệt cache ngắn các trang GET công khai thành công, còn lại chặn cache.
+    Trang cần đăng nhập hiển thị user và flash message nên luôn no-store.
+    """
+    view = app.view_functions.get(request.endpoint)
+    if (request.method == "GET" and response.status_code == 200
+            and request.endpoint not in NO_STORE_ENDPOINTS
+            and not getattr(view, "login_required", False)):
+        response.cache_control.private = True
+        response.cache_control.max_age = 30
+    else:
+        response.cache_control.no_store = True
     return response
 # =========================================================
 #               SESSION & SECURITY
 # =========================================================
 
-# ----------------- RESET SESSION ON STARTUP -----------------
-@app.before_request
-def clear_session_on_start():
-    if request.endpoint == 'static':
-        return
-    if not hasattr(app, '_session_cleared'):
-        session.clear()
-        app._session_cleared = True
+# ----------------- SERVER-SIDE SESSION (REDIS) -----------------
+# BOOT_ID phải giống nhau giữa mọi worker (gunicorn -w N), nên lấy từ config.SESSION_EPOCH đặt theo
+# mỗi lần deploy; nếu chưa cấu hình thì dùng mtime của app.py (đổi khi deploy code mới).
+# Đổi BOOT_ID -> session cũ tự mất hiệu lực (Redis: qua SESSION_KEY_PREFIX, cookie: qua login_required)
+BOOT_ID = str(getattr(config, "SESSION_EPOCH", None) or os.stat(__file__).st_mtime_ns)
+REDIS_URL = getattr(config, "REDIS_URL", None)
+redis_client = None
+if REDIS_URL:
+    try:
+        import redis
+        from flask_session import Session
+        redis_client = redis.Redis.from_url(REDIS_URL, socket_keepalive=True)
+        app.config.update(
+            SESSION_TYPE="redis",
+            SESSION_REDIS=redis_client,
+            SESSION_USE_SIGNER=True,
+            SESSION_PERMANENT=True,
+            SESSION_KEY_PREFIX=f"qlmv:{BOOT_ID}:",
+        )
+        Session(app)
+        log.info("✅ Redis session initialized.")
+    except Exception as e:
+        redis_client = None
+        log.error("❌ Redis session init failed: %s", e)
 
-@app.before_request
-def make_session_permanent():
-    session.permanent = True
+# ----------------- DATA CACHE -----------------
+# Dùng chung Redis với session nếu có, nếu không thì cache trong bộ nhớ process
+cache = Cache(app, config={
+    "CACHE_TYPE": "RedisCache" if redis_client is not None else "SimpleCache",
+    "CACHE_REDIS_URL": REDIS_URL,
+    "CACHE_DEFAULT_TIMEOUT": 60,
+})
 
 # ----------------- LOGIN CHECK DECORATOR -----------------
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user' not in session:
+        # Session tạo từ lần deploy trước (BOOT_ID khác) coi như đã hết hạn
+        if 'user' not in session or session.get('boot') != BOOT_ID:
+            session.clear()
             flash("Vui lòng đăng nhập để truy cập trang này.", "warning")
             return redirect(url_for('login'))
+        ensure_firestore_warm()
         return f(*args, **kwargs)
+    decorated_function.login_required = True
     return decorated_function
 # =========================================================
 #               INITIALIZATION
@@ -71,29 +196,226 @@ def login_required(f):
 
 # ----------------- LOAD MODEL -----------------
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "data", "yield_model.pkl")
-model = joblib.load(MODEL_PATH) if os.path.exists(MODEL_PATH) else None
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Nạp model lần đầu khi cần (mmap để các worker dùng chung bộ nhớ)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None and os.path.exists(MODEL_PATH):
+                _model = joblib.load(MODEL_PATH, mmap_mode='r')
+    return _model
 
 # ----------------- INIT FIREBASE -----------------
 db = None
 if config.USE_FIREBASE:
     try:
         db = init_firebase()
-        print("✅ Firebase initialized.")
+        log.info("✅ Firebase initialized.")
     except Exception as e:
         db = None
-        print("❌ Firebase init failed:", e)
+        log.error("❌ Firebase init failed: %s", e)
+
+# Warm-up: mở kênh gRPC (TLS/HTTP2) ở thread nền khi process bắt đầu phục vụ request.
+# Không chạy lúc import: kênh gRPC mở trước fork (gunicorn preload) không dùng được ở worker,
+# và Firestore không kết nối được thì worker vẫn khởi động bình thường.
+FIREBASE_WARMUP_TIMEOUT = 5
+_firestore_warm = False
+
+def _warm_up_firestore():
+    try:
+        db.collection("seasons").limit(1).get(timeout=FIREBASE_WARMUP_TIMEOUT)
+    except Exception as e:
+        log.warning("⚠️ Firebase warm-up query failed: %s", e)
+
+def ensure_firestore_warm():
+    """Chạy warm-up một lần cho mỗi process (reset sau fork)"""
+    global _firestore_warm
+    if _firestore_warm or db is None:
+        return
+    _firestore_warm = True
+    threading.Thread(target=_warm_up_firestore, daemon=True).start()
+
+def _reset_firestore_warm():
+    global _firestore_warm
+    _firestore_warm = False
+
+os.register_at_fork(after_in_child=_reset_firestore_warm)
 
 # ----------------- HELPER PATHS -----------------
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 USERS_CSV = os.path.join(DATA_DIR, "users.csv")
 SEASONS_CSV = os.path.join(DATA_DIR, "seasons.csv")
+SEASONS_PARQUET = os.path.join(DATA_DIR, "seasons.parquet")
 WEATHER_CSV = os.path.join(DATA_DIR, "weather_all_vn_annual_2000-2030.csv")
+WEATHER_PARQUET = os.path.join(DATA_DIR, "weather_all_vn_annual_2000-2030.parquet")
+
+# ----------------- WEATHER DATA -----------------
+def _read_csv_fast(path, **kwargs):
+    """Đọc CSV bằng engine pyarrow (đa luồng), quay về engine mặc định nếu chưa cài pyarrow"""
+    try:
+        return pd.read_csv(path, engine="pyarrow", **kwargs)
+    except ImportError:
+        return pd.read_csv(path, **kwargs)
+
+def _weather_frame():
+    """Đọc bảng thời tiết, ưu tiên bản Parquet (memory-map); tự tạo Parquet từ CSV khi chưa có hoặc CSV mới hơn"""
+    parquet_fresh = (
+        pq is not None and os.path.exists(WEATHER_PARQUET)
+        and (not os.path.exists(WEATHER_CSV) or os.path.getmtime(WEATHER_PARQUET) >= os.path.getmtime(WEATHER_CSV))
+    )
+    if parquet_fresh:
+        return pq.read_table(WEATHER_PARQUET, memory_map=True).to_pandas()
+    if not os.path.exists(WEATHER_CSV):
+        return None
+    df = _read_csv_fast(WEATHER_CSV, dtype={"province": "category"})
+    if pq is not None:
+        # Ghi ra file tạm rồi os.replace: file dở dang (crash, worker khác ghi cùng lúc) không bao giờ mang tên thật
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, prefix="weather.", suffix=".parquet.tmp")
+            os.close(fd)
+            df.to_parquet(tmp_path, compression="zstd", index=False)
+            os.replace(tmp_path, WEATHER_PARQUET)
+        except Exception as e:
+            log.warning("⚠️ Không ghi được file Parquet thời tiết: %s", e)
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return df
+
+@lru_cache(maxsize=1)
+def load_weather_by_province():
+    """Đọc dữ liệu thời tiết một lần duy nhất, nhóm sẵn theo tỉnh (và đánh index theo năm) để tra cứu O(1)"""
+    df = _weather_frame()
+    if df is None:
+        return {}
+    groups = {province: group for province, group in df.groupby("province", observed=True)}
+    if "year" in df:
+        groups = {province: group.set_index("year") for province, group in groups.items()}
+    return groups
 
 # =========================================================
 #               CORE FUNCTIONS
 # =========================================================
 
+# ----------------- BẢNG HỆ SỐ -----------------
+# Base yield by crop type (tấn/ha)
+BASE_YIELDS = MappingProxyType({
+    "lúa": 5.5,
+    "ngô": 4.8,
+    "hoa hướng dương": 2.5,
+    "cà phê": 2.2,
+    "cao su": 1.8,
+    "chè": 3.2,
+    "tiêu": 3.0,
+    "điều": 1.5,
+    "mía": 60.0,
+    "lạc": 2.2,
+    "đậu tương": 2.0
+})
+
+# Hệ số thời gian sinh trưởng: < 80 ngày -> 0.7, < 100 -> 0.9, ..., >= 150 -> 1.2
+GROWTH_EDGES = (80, 100, 120, 150)
+GROWTH_FACTORS = (0.7, 0.9, 1.0, 1.1, 1.2)
+
+# Hệ số phân bón
+FERTILIZER_FACTORS = MappingProxyType({
+    "hữu cơ": 1.2,
+    "vô cơ": 1.1,
+    "npk": 1.15,
+    "phân chuồng": 1.18,
+    "không": 0.8
+})
+
+# Hệ số vùng miền
+REGION_FACTORS = MappingProxyType({
+    "an giang": 1.3, "đồng tháp": 1.25, "long an": 1.2,
+    "hà nội": 1.1, "bắc ninh": 1.05, "hưng yên": 1.05,
+    "đắk lắk": 1.0, "đắk nông": 0.95, "gia lai": 0.95,
+    "bắc kạn": 0.9, "cao bằng": 0.85, "hà giang": 0.85
+})
+
+# Giá bán ước tính (VND/kg)
+CROP_PRICES = MappingProxyType({
+    "lúa": 7000, "ngô": 6000, "cà phê": 45000, "cao su": 35000,
+    "chè": 25000, "tiêu": 80000, "điều": 30000, "mía": 1000,
+    "lạc": 20000, "đậu tương": 15000
+})
+
+# Chi phí ước tính (VND/ha)
+COST_PER_HA = MappingProxyType({
+    "lúa": 15000000, "ngô": 18000000, "cà phê": 25000000,
+    "cao su": 15000000, "chè": 20000000, "default": 15000000
+})
+
+# Regex biên dịch sẵn cho từng bảng: tìm mọi từ khóa trong một lượt quét.
+# Lookahead để khớp chồng lấn ("long an giang" có cả "long an" và "an giang"), giữ đúng thứ tự ưu tiên của bảng
+def _compile_keywords(table):
+    pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in table) + "))")
+    rank = {k: i for i, k in enumerate(table)}
+    return pattern, rank
+
+_FERT_RE, _FERT_RANK = _compile_keywords(FERTILIZER_FACTORS)
+_REGION_RE, _REGION_RANK = _compile_keywords(REGION_FACTORS)
+
+def _match_factor(pattern, rank, table, text):
+    """Lấy hệ số của từ khóa khớp trong text, ưu tiên theo thứ tự khai báo trong bảng"""
+    found = pattern.findall(text)
+    if not found:
+        return 1.0
+    return table[min(found, key=rank.__getitem__)]
+
+# Tra cứu trực tiếp theo tên đã chuẩn hóa, chỉ quét regex khi không khớp chính xác
+_PROVINCE_PREFIXES = ("thành phố ", "tỉnh ", "tp. ", "tp ")
+
+def _normalize_key(text):
+    """Chuẩn hóa chuỗi tiếng Việt (NFC, không phân biệt hoa thường) để tra bảng"""
+    return unicodedata.normalize("NFC", text).casefold().strip()
+
+def _normalize_province(province):
+    name = _normalize_key(province)
+    for prefix in _PROVINCE_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):].strip()
+    return name
+
+FERTILIZER_LOOKUP = {_normalize_key(k): v for k, v in FERTILIZER_FACTORS.items()}
+REGION_LOOKUP = {_normalize_key(k): v for k, v in REGION_FACTORS.items()}
+
+def _fertilizer_factor(fertilizer):
+    name = _normalize_key(fertilizer)
+    factor = FERTILIZER_LOOKUP.get(name)
+    if factor is None:
+        factor = _match_factor(_FERT_RE, _FERT_RANK, FERTILIZER_FACTORS, name)
+    return factor
+
+def _region_factor(province):
+    name = _normalize_province(province)
+    factor = REGION_LOOKUP.get(name)
+    if factor is None:
+        factor = _match_factor(_REGION_RE, _REGION_RANK, REGION_FACTORS, name)
+    return factor
+
+# fromisoformat (3.11+) nhận cả "20240101" hay "2024-W01-1": chỉ dùng nó cho đúng dạng YYYY-MM-DD
+_ISO_DATE_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+@lru_cache(maxsize=1024)
+def _parse_date(value):
+    """Parse ngày dạng YYYY-MM-DD; fromisoformat chạy bằng C, strptime chỉ dùng cho ngày không đệm số 0"""
+    if _ISO_DATE_RE.fullmatch(value):
+        return date.fromisoformat(value)
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
 # ----------------- YIELD CALCULATION FUNCTION -----------------
+def _text_value(value, lower=True):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    text = str(value).strip()
+    return text.lower() if lower else text
+
 def calculate_yield(season_data):
     """
     Tính toán năng suất tự động dựa trên:
@@ -104,97 +426,176 @@ def calculate_yield(season_data):
     - Tỉnh thành (province) - ảnh hưởng thời tiết
     """
     try:
-        # Base yield by crop type (tấn/ha)
-        base_yields = {
-            "lúa": 5.5,
-            "ngô": 4.8,
-            "hoa hướng dương": 2.5,
-            "cà phê": 2.2,
-            "cao su": 1.8,
-            "chè": 3.2,
-            "tiêu": 3.0,
-            "điều": 1.5,
-            "mía": 60.0,
-            "lạc": 2.2,
-            "đậu tương": 2.0
-        }
-        
-        crop = season_data.get("crop", "").strip().lower()
+        # Bản ghi từ CSV (to_dict) có NaN ở ô trống: xử lý như chuỗi rỗng giống calculate_yield_bulk
+        crop = _text_value(season_data.get("crop"))
         area = float(season_data.get("area", 1))
-        fertilizer = season_data.get("fertilizer", "").strip().lower()
-        
-        # Base yield từ loại cây trồng
-        base_yield = base_yields.get(crop, 4.0)
-        
-        # Tính thời gian sinh trưởng
-        sow_date_str = season_data.get("sow_date")
-        harvest_date_str = season_data.get("harvest_date")
-        
-        growth_days = 90  # mặc định 90 ngày
-        
-        if sow_date_str and harvest_date_str:
-            try:
-                sow_date = datetime.strptime(sow_date_str, "%Y-%m-%d")
-                harvest_date = datetime.strptime(harvest_date_str, "%Y-%m-%d")
-                growth_days = (harvest_date - sow_date).days
-                growth_days = max(60, min(180, growth_days))
-            except:
-                growth_days = 90
-        
-        # Hệ số thời gian sinh trưởng
-        if growth_days < 80:
-            growth_factor = 0.7
-        elif growth_days < 100:
-            growth_factor = 0.9
-        elif growth_days < 120:
-            growth_factor = 1.0
-        elif growth_days < 150:
-            growth_factor = 1.1
-        else:
-            growth_factor = 1.2
-        
-        # Hệ số phân bón
-        fertilizer_factors = {
-            "hữu cơ": 1.2,
-            "vô cơ": 1.1,
-            "npk": 1.15,
-            "phân chuồng": 1.18,
-            "không": 0.8
-        }
-        
-        fertilizer_factor = 1.0
-        for fert_type, factor in fertilizer_factors.items():
-            if fert_type in fertilizer:
-                fertilizer_factor = factor
-                break
+        if pd.isna(area):
+            return None
+        fertilizer = _text_value(season_data.get("fertilizer"))
+        province = _text_value(season_data.get("province"))
+        sow_date_str = _text_value(season_data.get("sow_date"), lower=False)
+        harvest_date_str = _text_value(season_data.get("harvest_date"), lower=False)
         
-        # Hệ số vùng miền
-        region_factors = {
-            "an giang": 1.3, "đồng tháp": 1.25, "long an": 1.2,
-            "hà nội": 1.1, "bắc ninh": 1.05, "hưng yên": 1.05,
-            "đắk lắk": 1.0, "đắk nông": 0.95, "gia lai": 0.95,
-            "bắc kạn": 0.9, "cao bằng": 0.85, "hà giang": 0.85
-        }
-        
-        province = season_data.get("province", "").strip().lower()
-        region_factor = 1.0
-        for region, factor in region_factors.items():
-            if region in province:
-                region_factor = factor
-                break
-        
-        # Tính năng suất cuối cùng (tấn/ha)
-        final_yield_per_ha = base_yield * growth_factor * fertilizer_factor * region_factor
-        
-        # Áp dụng cho diện tích cụ thể (tổng sản lượng)
-        total_yield = final_yield_per_ha * area
-        
-        return round(total_yield, 2)
+        return _calc_yield_cached(crop, area, sow_date_str, harvest_date_str, fertilizer, province)
         
     except Exception as e:
-        print(f"Lỗi tính năng suất: {e}")
+        log.warning("Lỗi tính năng suất: %s", e)
         return None
 
+@lru_cache(maxsize=4096)
+def _calc_yield_cached(crop, area, sow_date_str, harvest_date_str, fertilizer, province):
+    """Phần tính toán thuần của calculate_yield, cache theo bộ tham số"""
+    # Base yield từ loại cây trồng
+    base_yield = BASE_YIELDS.get(crop, 4.0)
+    
+    # Tính thời gian sinh trưởng
+    growth_days = 90  # mặc định 90 ngày
+    
+    if sow_date_str and harvest_date_str:
+        try:
+            sow_date = _parse_date(sow_date_str)
+            harvest_date = _parse_date(harvest_date_str)
+            growth_days = (harvest_date - sow_date).days
+            growth_days = max(60, min(180, growth_days))
+        except:
+            growth_days = 90
+    
+    # Hệ số thời gian sinh trưởng
+    growth_factor = GROWTH_FACTORS[bisect.bisect_right(GROWTH_EDGES, growth_days)]
+    
+    # Hệ số phân bón
+    fertilizer_factor = _fertilizer_factor(fertilizer)
+    
+    # Hệ số vùng miền
+    region_factor = _region_factor(province)
+    
+    # Tính năng suất cuối cùng (tấn/ha)
+    final_yield_per_ha = base_yield * growth_factor * fertilizer_factor * region_factor
+    
+    # Áp dụng cho diện tích cụ thể (tổng sản lượng)
+    total_yield = final_yield_per_ha * area
+    
+    return round(total_yield, 2)
+
+# ----------------- BULK YIELD CALCULATION -----------------
+# Nhiều hơn số bản ghi này thì tính bằng pandas/NumPy thay vì gọi calculate_yield từng dòng
+BULK_YIELD_THRESHOLD = 5
+
+def _text_column(df, name):
+    if name not in df:
+        return pd.Series("", index=df.index)
+    return df[name].fillna("").astype(str).str.strip().str.lower()
+
+def _date_column(df, name):
+    """Cột ngày dạng chuỗi đã strip, parse giống _parse_date (chỉ nhận %Y-%m-%d)"""
+    return pd.to_datetime(df[name].fillna("").astype(str).str.strip(), format="%Y-%m-%d", errors="coerce")
+
+def _map_unique(series, func):
+    """Áp dụng func một lần cho mỗi giá trị khác nhau rồi map lại cả cột"""
+    return series.map({value: func(value) for value in series.unique()})
+
+# Phép nhân cuối cùng chạy bằng kernel Numba nếu có cài numba.
+# Khai báo kiểu để biên dịch ngay lúc import (không bắt request đầu tiên chờ JIT); không dùng
+# parallel=True vì mỗi lượt chỉ vài dòng, được gọi từ thread của request.
+if numba is not None:
+    # Cột lấy từ pandas (copy-on-write) là mảng chỉ đọc
+    _ro_floats = numba.types.Array(numba.float64, 1, "A", readonly=True)
+    
+    @numba.njit(numba.float64[:](_ro_floats, _ro_floats, _ro_floats, _ro_floats, _ro_floats, numba.float64[:]), cache=True)
+    def _bulk_yield(base, growth, fertilizer, region, area, out):
+        for i in range(base.size):
+            out[i] = base[i] * growth[i] * fertilizer[i] * region[i] * area[i]
+        return out
+else:
+    def _bulk_yield(base, growth, fertilizer, region, area, out):
+        return np.multiply(base * growth * fertilizer * region, area, out=out)
+
+def calculate_yield_bulk(seasons_df):
+    """
+    Phiên bản vector hóa của calculate_yield cho nhiều mùa vụ cùng lúc.
+    Trả về Series tổng sản lượng (tấn), NaN với dòng có diện tích không hợp lệ.
+    """
+    index = seasons_df.index
+    base = _text_column(seasons_df, "crop").map(BASE_YIELDS).fillna(4.0)
+    
+    if "area" in seasons_df:
+        area = pd.to_numeric(seasons_df["area"], errors="coerce")
+    else:
+        area = pd.Series(1.0, index=index)
+    
+    # Thời gian sinh trưởng, mặc định 90 ngày nếu thiếu hoặc sai định dạng ngày
+    if "sow_date" in seasons_df and "harvest_date" in seasons_df:
+        sow = _date_column(seasons_df, "sow_date")
+        harvest = _date_column(seasons_df, "harvest_date")
+        growth_days = (harvest - sow).dt.days.clip(60, 180).fillna(90)
+    else:
+        growth_days = pd.Series(90, index=index)
+    growth = pd.Series(
+        np.asarray(GROWTH_FACTORS)[np.searchsorted(GROWTH_EDGES, growth_days.to_numpy(), side="right")],
+        index=index,
+    )
+    
+    fertilizer = _map_unique(_text_column(seasons_df, "fertilizer"), _fertilizer_factor)
+    region = _map_unique(_text_column(seasons_df, "province"), _region_factor)
+    
+    out = np.empty(len(index), dtype=np.float64)
+    _bulk_yield(
+        base.to_numpy(np.float64), growth.to_numpy(np.float64), fertilizer.to_numpy(np.float64),
+        region.to_numpy(np.float64), area.to_numpy(np.float64), out,
+    )
+    return pd.Series(out, index=index).round(2)
+
+def predict_yields(seasons):
+    """Tính năng suất cho danh sách mùa vụ, dùng calculate_yield_bulk khi danh sách đủ lớn"""
+    if len(seasons) > BULK_YIELD_THRESHOLD:
+        try:
+            yields = calculate_yield_bulk(pd.DataFrame(seasons))
+            return [None if pd.isna(y) else float(y) for y in yields]
+        except Exception as e:
+            log.warning("Lỗi tính năng suất hàng loạt: %s", e)
+    return [calculate_yield(season) for season in seasons]
+
+# ----------------- DỮ LIỆU HỖ TRỢ QUYẾT ĐỊNH -----------------
+# Khuyến nghị theo loại cây trồng
+CROP_RECOMMENDATIONS = MappingProxyType({
+    "lúa": (
+        "🌾 Bón thúc đợt 1: 7-10 ngày sau sạ",
+        "💧 Duy trì mực nước 3-5cm trong giai đoạn đẻ nhánh",
+        "🛡️ Phòng trừ sâu bệnh: đạo ôn, rầy nâu",
+        "📅 Thu hoạch khi 85-90% hạt chín vàng"
+    ),
+    "ngô": (
+        "🌱 Bón lót phân chuồng + lân trước khi gieo",
+        "💦 Tưới đủ ẩm giai đoạn trỗ cờ phun râu",
+        "🪲 Phòng trừ sâu đục thân, bệnh khô vằn",
+        "🌽 Thu hoạch khi hạt cứng, râu chuyển nâu"
+    ),
+    "cà phê": (
+        "🌿 Tỉa cành tạo tán sau thu hoạch",
+        "💧 Tưới nước đầy đủ mùa khô",
+        "🍂 Bón phân NPK cân đối theo giai đoạn",
+        "☀️ Che bóng hợp lý tránh nắng gắt"
+    )
+})
+
+# Khuyến nghị chung
+GENERAL_RECOMMENDATIONS = (
+    "📊 Theo dõi thời tiết thường xuyên để điều chỉnh lịch chăm sóc",
+    "🌱 Kiểm tra độ ẩm đất trước khi tưới nước",
+    "🔍 Thăm đồng thường xuyên để phát hiện sâu bệnh sớm",
+    "📝 Ghi chép nhật ký đồng ruộng để cải thiện vụ sau"
+)
+
+NO_FERTILIZER_WARNING = "⚠️ Chưa sử dụng phân bón - có thể ảnh hưởng năng suất"
+
+# Dữ liệu biểu đồ (mẫu)
+GROWTH_STAGES = (
+    MappingProxyType({"stage": "Gieo trồng", "progress": 100, "tasks": ("Làm đất", "Gieo hạt")}),
+    MappingProxyType({"stage": "Phát triển", "progress": 65, "tasks": ("Bón thúc", "Tưới nước")}),
+    MappingProxyType({"stage": "Ra hoa", "progress": 30, "tasks": ("Bón phân", "Phun thuốc")}),
+    MappingProxyType({"stage": "Thu hoạch", "progress": 0, "tasks": ("Chuẩn bị thu", "Bảo quản")})
+)
+
 # ----------------- DECISION SUPPORT FUNCTION -----------------
 def generate_decision_support(season_data, predicted_yield):
     """
@@ -203,112 +604,66 @@ def generate_decision_support(season_data, predicted_yield):
     try:
         crop = season_data.get("crop", "").strip().lower()
         area = float(season_data.get("area", 1))
-        province = season_data.get("province", "")
         fertilizer = season_data.get("fertilizer", "")
+        no_fertilizer = not fertilizer or "không" in fertilizer.lower()
         
-        # Tính toán các chỉ số
-        yield_per_ha = predicted_yield / area if area > 0 else 0
-        
-        # Phân loại năng suất
-        if yield_per_ha >= 6:
-            yield_category = "Rất cao"
-            yield_color = "text-green-600"
-            yield_bg = "bg-green-100"
-        elif yield_per_ha >= 4:
-            yield_category = "Cao"
-            yield_color = "text-green-500"
-            yield_bg = "bg-green-50"
-        elif yield_per_ha >= 2:
-            yield_category = "Trung bình"
-            yield_color = "text-yellow-600"
-            yield_bg = "bg-yellow-50"
-        else:
-            yield_category = "Thấp"
-            yield_color = "text-red-600"
-            yield_bg = "bg-red-50"
-        
-        # Khuyến nghị theo loại cây trồng
-        crop_recommendations = {
-            "lúa": [
-                "🌾 Bón thúc đợt 1: 7-10 ngày sau sạ",
-                "💧 Duy trì mực nước 3-5cm trong giai đoạn đẻ nhánh",
-                "🛡️ Phòng trừ sâu bệnh: đạo ôn, rầy nâu",
-                "📅 Thu hoạch khi 85-90% hạt chín vàng"
-            ],
-            "ngô": [
-                "🌱 Bón lót phân chuồng + lân trước khi gieo",
-                "💦 Tưới đủ ẩm giai đoạn trỗ cờ phun râu",
-                "🪲 Phòng trừ sâu đục thân, bệnh khô vằn",
-                "🌽 Thu hoạch khi hạt cứng, râu chuyển nâu"
-            ],
-            "cà phê": [
-                "🌿 Tỉa cành tạo tán sau thu hoạch",
-                "💧 Tưới nước đầy đủ mùa khô",
-                "🍂 Bón phân NPK cân đối theo giai đoạn",
-                "☀️ Che bóng hợp lý tránh nắng gắt"
-            ]
-        }
-        
-        # Khuyến nghị chung
-        general_recommendations = [
-            "📊 Theo dõi thời tiết thường xuyên để điều chỉnh lịch chăm sóc",
-            "🌱 Kiểm tra độ ẩm đất trước khi tưới nước",
-            "🔍 Thăm đồng thường xuyên để phát hiện sâu bệnh sớm",
-            "📝 Ghi chép nhật ký đồng ruộng để cải thiện vụ sau"
-        ]
-        
-        # Cảnh báo dựa trên điều kiện
-        warnings = []
-        if not fertilizer or "không" in fertilizer.lower():
-            warnings.append("⚠️ Chưa sử dụng phân bón - có thể ảnh hưởng năng suất")
-        
-        # Phân tích lợi nhuận ước tính
-        crop_prices = {
-            "lúa": 7000, "ngô": 6000, "cà phê": 45000, "cao su": 35000,
-            "chè": 25000, "tiêu": 80000, "điều": 30000, "mía": 1000,
-            "lạc": 20000, "đậu tương": 15000
-        }
-        
-        price_per_kg = crop_prices.get(crop, 10000)
-        estimated_revenue = predicted_yield * 1000 * price_per_kg
-        
-        # Chi phí ước tính (VND/ha)
-        cost_per_ha = {
-            "lúa": 15000000, "ngô": 18000000, "cà phê": 25000000,
-            "cao su": 15000000, "chè": 20000000, "default": 15000000
-        }
-        
-        cost = cost_per_ha.get(crop, cost_per_ha["default"]) * area
-        estimated_profit = estimated_revenue - cost
-        
-        # Tạo dữ liệu biểu đồ (mẫu)
-        growth_stages = [
-            {"stage": "Gieo trồng", "progress": 100, "tasks": ["Làm đất", "Gieo hạt"]},
-            {"stage": "Phát triển", "progress": 65, "tasks": ["Bón thúc", "Tưới nước"]},
-            {"stage": "Ra hoa", "progress": 30, "tasks": ["Bón phân", "Phun thuốc"]},
-            {"stage": "Thu hoạch", "progress": 0, "tasks": ["Chuẩn bị thu", "Bảo quản"]}
-        ]
-        
-        return {
-            "yield_per_ha": round(yield_per_ha, 2),
-            "yield_category": yield_category,
-            "yield_color": yield_color,
-            "yield_bg": yield_bg,
-            "crop_recommendations": crop_recommendations.get(crop, general_recommendations),
-            "general_recommendations": general_recommendations,
-            "warnings": warnings,
-            "estimated_revenue": f"{estimated_revenue:,.0f}",
-            "estimated_profit": f"{estimated_profit:,.0f}",
-            "cost": f"{cost:,.0f}",
-            "growth_stages": growth_stages,
-            "profit_margin": round((estimated_profit / estimated_revenue * 100) if estimated_revenue > 0 else 0, 1),
-            "price_per_kg": f"{price_per_kg:,.0f}"
-        }
+        # Trả về bản sao để caller có thể sửa mà không ảnh hưởng cache
+        return dict(_decision_support_cached(crop, area, no_fertilizer, predicted_yield))
         
     except Exception as e:
-        print(f"Lỗi tạo hỗ trợ quyết định: {e}")
+        log.warning("Lỗi tạo hỗ trợ quyết định: %s", e)
         return None
 
+@lru_cache(maxsize=1024)
+def _decision_support_cached(crop, area, no_fertilizer, predicted_yield):
+    """Phần tính toán thuần của generate_decision_support, cache theo bộ tham số"""
+    # Tính toán các chỉ số
+    yield_per_ha = predicted_yield / area if area > 0 else 0
+    
+    # Phân loại năng suất
+    if yield_per_ha >= 6:
+        yield_category = "Rất cao"
+        yield_color = "text-green-600"
+        yield_bg = "bg-green-100"
+    elif yield_per_ha >= 4:
+        yield_category = "Cao"
+        yield_color = "text-green-500"
+        yield_bg = "bg-green-50"
+    elif yield_per_ha >= 2:
+        yield_category = "Trung bình"
+        yield_color = "text-yellow-600"
+        yield_bg = "bg-yellow-50"
+    else:
+        yield_category = "Thấp"
+        yield_color = "text-red-600"
+        yield_bg = "bg-red-50"
+    
+    # Cảnh báo dựa trên điều kiện
+    warnings = (NO_FERTILIZER_WARNING,) if no_fertilizer else ()
+    
+    # Phân tích lợi nhuận ước tính
+    price_per_kg = CROP_PRICES.get(crop, 10000)
+    estimated_revenue = predicted_yield * 1000 * price_per_kg
+    
+    cost = COST_PER_HA.get(crop, COST_PER_HA["default"]) * area
+    estimated_profit = estimated_revenue - cost
+    
+    return {
+        "yield_per_ha": round(yield_per_ha, 2),
+        "yield_category": yield_category,
+        "yield_color": yield_color,
+        "yield_bg": yield_bg,
+        "crop_recommendations": CROP_RECOMMENDATIONS.get(crop, GENERAL_RECOMMENDATIONS),
+        "general_recommendations": GENERAL_RECOMMENDATIONS,
+        "warnings": warnings,
+        "estimated_revenue": f"{estimated_revenue:,.0f}",
+        "estimated_profit": f"{estimated_profit:,.0f}",
+        "cost": f"{cost:,.0f}",
+        "growth_stages": GROWTH_STAGES,
+        "profit_margin": round((estimated_profit / estimated_revenue * 100) if estimated_revenue > 0 else 0, 1),
+        "price_per_kg": f"{price_per_kg:,.0f}"
+    }
+
 
 # ----------------- CALCULATE PRODUCTIVITY FOR STATS -----------------
 def calculate_productivity(season_data):
@@ -326,8 +681,14 @@ def calculate_productivity(season_data):
         return 0.0
 
 # ----------------- FIREBASE WITH RETRY -----------------
+_db_init_lock = threading.Lock()
+
 def get_firestore_with_retry():
-    """Kết nối Firebase với retry mechanism"""
+    """
+    Kết nối Firebase với retry mechanism.
+    Client khởi tạo lại được gán vào db toàn cục để mọi request dùng chung một kênh gRPC.
+    """
+    global db
     max_retries = 2
     timeout_seconds = 10
     
@@ -335,38 +696,90 @@ def get_firestore_with_retry():
         try:
             if config.USE_FIREBASE:
                 if db is None:
-                    print(f"🔄 Attempt {attempt + 1} to initialize Firebase...")
-                    db_retry = init_firebase()
-                    if db_retry:
-                        print("✅ Firebase initialized with retry")
-                        return db_retry
+                    with _db_init_lock:
+                        if db is None:
+                            log.info("🔄 Attempt %d to initialize Firebase...", attempt + 1)
+                            db = init_firebase()
+                            if db is not None:
+                                log.info("✅ Firebase initialized with retry")
+                    if db is not None:
+                        return db
                 else:
                     # Test connection với timeout
-                    print(f"🔄 Attempt {attempt + 1} to test Firebase connection...")
+                    log.debug("🔄 Attempt %d to test Firebase connection...", attempt + 1)
                     test_ref = db.collection("seasons").limit(1)
                     list(test_ref.stream())  # Test query nhỏ
-                    print("✅ Firebase connection test passed")
+                    log.debug("✅ Firebase connection test passed")
                     return db
             else:
                 return None
                 
         except Exception as e:
-            print(f"❌ Firebase attempt {attempt + 1} failed: {str(e)[:100]}...")
+            log.warning("❌ Firebase attempt %d failed: %.100s...", attempt + 1, e)
             if attempt < max_retries - 1:
                 import time
                 time.sleep(1)  # Chờ 1 giây trước khi retry
             else:
-                print("🚨 All Firebase connection attempts failed")
+                log.error("🚨 All Firebase connection attempts failed")
                 return None
     
     return None
 
+# ----------------- REDIS CACHE FOR FIREBASE -----------------
+FIREBASE_CACHE_TTL = getattr(config, "FIREBASE_CACHE_TTL", 60)
+
+# Giá trị được pickle (giống Flask-Caching) để cache hit trả về đúng kiểu như khi đọc Firestore
+# (datetime, GeoPoint...), không bị chuyển thành chuỗi như khi dùng JSON.
+# Mỗi collection có một set chứa các key đã cache -> xóa theo set, không SCAN toàn bộ Redis.
+def _firebase_cache_index(collection_name):
+    return f"fb:{collection_name}:keys"
+
+def _cache_get(key):
+    """Đọc giá trị từ Redis, trả về None nếu không có hoặc lỗi"""
+    if redis_client is None:
+        return None
+    try:
+        cached = redis_client.get(key)
+        return pickle.loads(cached) if cached else None
+    except Exception as e:
+        log.warning("⚠️ Lỗi đọc Redis cache: %s", e)
+        return None
+
+def _cache_set(collection_name, key, value, ttl):
+    if redis_client is None:
+        return
+    try:
+        index_key = _firebase_cache_index(collection_name)
+        pipe = redis_client.pipeline()
+        pipe.setex(key, ttl, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        pipe.sadd(index_key, key)
+        pipe.expire(index_key, ttl)
+        pipe.execute()
+    except Exception as e:
+        log.warning("⚠️ Lỗi ghi Redis cache: %s", e)
+
+def invalidate_firebase_cache(collection_name):
+    """Xóa cache các query của collection sau khi ghi dữ liệu"""
+    if redis_client is None:
+        return
+    try:
+        index_key = _firebase_cache_index(collection_name)
+        keys = redis_client.smembers(index_key)
+        redis_client.delete(index_key, *keys)
+    except Exception as e:
+        log.warning("⚠️ Lỗi xóa Redis cache: %s", e)
+
 # ----------------- OPTIMIZED FIREBASE QUERY -----------------
 def safe_firebase_query(collection_name, limit=50, order_by=None):
     """Thực hiện query Firebase an toàn với timeout"""
     try:
         if not config.USE_FIREBASE or db is None:
             return []
+        
+        cache_key = f"fb:{collection_name}:{order_by}:{limit}"
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
             
         collection_ref = db.collection(collection_name)
         
@@ -377,74 +790,395 @@ def safe_firebase_query(collection_name, limit=50, order_by=None):
         # Giới hạn số lượng documents
         collection_ref = collection_ref.limit(limit)
         
-        # Lấy documents
-        docs = list(collection_ref.stream())
+        # Lấy documents trong một lần gọi
+        docs = collection_ref.get()
+        results = [{**doc.to_dict(), "id": doc.id} for doc in docs]
+        if not results:
+            return results
         
-        # Xử lý dữ liệu
-        results = []
-        for doc in docs:
-            try:
-                record = doc.to_dict()
-                record["id"] = doc.id
-                
-                # Xử lý số liệu an toàn
-                if record.get("actual_yield"):
-                    try:
-                        record["actual_yield"] = float(record["actual_yield"])
-                    except:
-                        record["actual_yield"] = 0.0
-                else:
-                    record["actual_yield"] = 0.0
-                    
-                if record.get("area"):
-                    try:
-                        record["area"] = float(record["area"])
-                    except:
-                        record["area"] = 0.0
-                else:
-                    record["area"] = 0.0
-                
-                results.append(record)
-            except Exception as doc_error:
-                print(f"⚠️ Lỗi xử lý document {doc.id}: {doc_error}")
-                continue
-                
+        # Xử lý số liệu an toàn - ép kiểu cả cột một lần
+        for field in ("actual_yield", "area"):
+            values = pd.to_numeric(pd.Series([r.get(field) for r in results], dtype=object), errors="coerce")
+            for record, value in zip(results, values.fillna(0.0).astype(float).tolist()):
+                record[field] = value
+        
+        _cache_set(collection_name, cache_key, results, FIREBASE_CACHE_TTL)
         return results
         
     except Exception as e:
-        print(f"❌ Lỗi Firebase query: {e}")
+        log.warning("❌ Lỗi Firebase query: %s", e)
         return []
 
+# ----------------- BATCHED FIREBASE WRITES -----------------
+# Firestore giới hạn 500 thao tác cho mỗi WriteBatch
+FIRESTORE_BATCH_LIMIT = 500
+
+def _batch_slices(records):
+    return [records[start:start + FIRESTORE_BATCH_LIMIT] for start in range(0, len(records), FIRESTORE_BATCH_LIMIT)]
+
+def bulk_write(collection_name, records):
+    """Ghi nhiều document mới theo lô 500, các lô được commit song song trên _fb_pool"""
+    if not config.USE_FIREBASE or db is None or not records:
+        return 0
+    collection_ref = db.collection(collection_name)
+    
+    def commit(chunk):
+        batch = db.batch()
+        for record in chunk:
+            batch.set(collection_ref.document(), record)
+        batch.commit()
+    
+    list(_fb_pool.map(commit, _batch_slices(records)))
+    invalidate_firebase_cache(collection_name)
+    return len(records)
+
+def bulk_update(collection_name, updates):
+    """
+    Cập nhật nhiều document theo lô 500, updates là danh sách (doc_id, fields).
+    Các lô commit song song trên _fb_pool; lô nào lỗi thì thử lại từng document.
+    Trả về số document cập nhật thành công.
+    """
+    if not config.USE_FIREBASE or db is None or not updates:
+        return 0
+    collection_ref = db.collection(collection_name)
+    
+    def commit(chunk):
+        batch = db.batch()
+        for doc_id, fields in chunk:
+            batch.update(collection_ref.document(doc_id), fields)
+        try:
+            batch.commit()
+            return len(chunk)
+        except Exception as e:
+            log.warning("⚠️ Commit lô Firestore thất bại, thử lại từng document: %s", e)
+        updated = 0
+        for doc_id, fields in chunk:
+            try:
+                collection_ref.document(doc_id).update(fields)
+                updated += 1
+            except Exception as doc_error:
+                log.warning("❌ Lỗi cập nhật document %s: %s", doc_id, doc_error)
+        return updated
+    
+    updated = sum(_fb_pool.map(commit, _batch_slices(updates)))
+    invalidate_firebase_cache(collection_name)
+    return updated
+
+# ----------------- PARALLEL FIREBASE QUERIES -----------------
+# Client Firestore (db) dùng chung giữa các thread, chỉ cần pool để gửi song song
+_fb_pool = ThreadPoolExecutor(max_workers=8)
+
+def parallel_firebase_queries(specs):
+    """
+    Chạy nhiều safe_firebase_query song song, mỗi spec là dict tham số.
+    Tổng thời gian bằng query chậm nhất thay vì tổng các query.
+    """
+    return list(_fb_pool.map(lambda spec: safe_firebase_query(**spec), specs))
+
 # =========================================================
 #               ROUTES
 # =========================================================
 
-@app.route("/")
-@login_required
-def index():
+@cache.memoize(timeout=60)
+def _load_index_data(user):
+    """
+    Tổng số mùa vụ và 5 mùa vụ mới nhất cho trang chủ (cache riêng theo user).
+    Trả về None khi đọc Firestore lỗi để kết quả rỗng không bị cache.
+    """
     total = 0
     recent = []
     if config.USE_FIREBASE and db is not None:
         try:
-            docs = db.collection("seasons").order_by("created_at", direction=firestore.Query.DESCENDING).limit(5).stream()
-            for d in docs:
-                recent.append(d.to_dict())
-            total = len(list(db.collection("seasons").limit(1000).stream()))
+            seasons_ref = db.collection("seasons")
+            # Đếm bằng aggregation phía server, chạy song song với query 5 mùa vụ mới nhất
+            count_future = _fb_pool.submit(lambda: seasons_ref.count().get()[0][0].value)
+            docs = seasons_ref.order_by("created_at", direction=firestore.Query.DESCENDING).limit(5).stream()
+            recent = [d.to_dict() for d in docs]
+            total = count_future.result()
         except Exception as e:
-            print("Lỗi đọc Firestore:", e)
-            total = 0
+            log.warning("Lỗi đọc Firestore: %s", e)
+            return None
     else:
         if os.path.exists(SEASONS_CSV):
             df = pd.read_csv(SEASONS_CSV)
             total = len(df)
             recent = df.sort_values("created_at", ascending=False).head(5).to_dict(orient="records")
+    return total, recent
+
+def invalidate_season_caches():
+    """Xóa mọi cache phụ thuộc collection seasons sau khi ghi dữ liệu"""
+    invalidate_firebase_cache("seasons")
+    cache.delete_memoized(_load_index_data)
+    cache.delete_memoized(_compute_overview_stats)
+
+@app.route("/")
+@login_required
+def index():
+    total, recent = _load_index_data(session['user']) or (0, [])
     return render_template("index.html", total=total, recent=recent)
 
 # ---------- OVERVIEW (OPTIMIZED) ----------
-@app.route("/overview")
-@login_required
-def overview():
-    stats = {
+OVERVIEW_SEASON_FIELDS = ["crop", "area", "province", "actual_yield"]
+# Các trường chỉ cần khi tính năng suất, chỉ tải cho những mùa vụ còn thiếu actual_yield
+YIELD_INPUT_FIELDS = ["sow_date", "harvest_date", "fertilizer"]
+
+SEASONS_CHUNK_ROWS = 1 << 18
+# Cột nhãn đọc dạng category (group-by trên mã số nguyên), cột số dạng float32 để giảm một nửa bộ nhớ
+SEASONS_CSV_DTYPES = MappingProxyType({
+    "province": "category",
+    "crop": "category",
+    "farmer_name": "category",
+    "area": "float32",
+    "actual_yield": "float32"
+})
+SEASONS_CSV_LABEL_DTYPES = MappingProxyType({
+    column: dtype for column, dtype in SEASONS_CSV_DTYPES.items() if dtype == "category"
+})
+AUTO_YIELD_COLUMNS = ("actual_yield", "yield_calculated_at", "yield_source")
+
+def _column_or(df, name, default):
+    return df[name] if name in df else pd.Series(default, index=df.index)
+
+def _partial_overview_stats(df):
+    """
+    Tổng hợp một phần (một chunk) dữ liệu mùa vụ, gộp lại ở _finalize_overview_stats.
+    Group-by trên nhãn gốc (category), việc chuẩn hóa nhãn để dành cho kết quả đã gộp.
+    """
+    # Cột đọc vào có thể là float32; cộng dồn bằng float64 để tổng không bị sai số tích lũy
+    area = pd.to_numeric(_column_or(df, "area", 0), errors="coerce").fillna(0.0).astype("float64")
+    actual_yield = pd.to_numeric(_column_or(df, "actual_yield", np.nan), errors="coerce").astype("float64")
+    data = pd.DataFrame({
+        "province": _column_or(df, "province", None),
+        "crop": _column_or(df, "crop", None),
+        "area": area,
+        "actual_yield": actual_yield
+    })
+    mask = data["actual_yield"].notna() & (data["actual_yield"] != 0) & (data["area"] > 0)
+    group_options = {"sort": False, "observed": True, "dropna": False}
+    return {
+        "total_seasons": len(data),
+        "total_area": float(area.sum()),
+        "area_by_province": data.groupby("province", **group_options)["area"].sum(),
+        "crop_counts": data.groupby("crop", **group_options).size(),
+        "crop_province": data[mask].groupby(["crop", "province"], **group_options)[["area", "actual_yield"]].sum(),
+    }
+
+def _overview_labels(index):
+    """Chuẩn hóa nhãn tỉnh/cây trồng trên index của kết quả group-by thay vì trên từng dòng"""
+    frame = index.to_frame(index=False)
+    if "province" in frame:
+        frame["province"] = frame["province"].astype(object).fillna("Chưa xác định")
+    if "crop" in frame:
+        frame["crop"] = frame["crop"].astype(object).fillna("Chưa xác định").astype(str).str.strip().str.lower()
+    if index.nlevels > 1:
+        return pd.MultiIndex.from_frame(frame)
+    return pd.Index(frame[index.name], name=index.name)
+
+def _combine_partials(parts, key):
+    """Nối kết quả group-by của các chunk rồi group-by lần cuối theo nhãn đã chuẩn hóa"""
+    combined = pd.concat([part[key] for part in parts])
+    combined.index = _overview_labels(combined.index)
+    return combined.groupby(level=list(combined.index.names), sort=False).sum()
+
+def _finalize_overview_stats(parts, stats):
+    """Gộp thống kê từng chunk thành kết quả cho trang tổng quan"""
+    stats["total_seasons"] = sum(part["total_seasons"] for part in parts)
+    
+    # Tổng diện tích và top tỉnh theo diện tích
+    # Tính toán trên tổng chưa làm tròn, chỉ làm tròn 2 chữ số khi đưa vào kết quả
+    # (bỏ nhiễu float32 của bản Parquet/CSV đọc theo dtype)
+    stats["total_area"] = round(sum(part["total_area"] for part in parts), 2)
+    area_by_province = _combine_partials(parts, "area_by_province")
+    stats["top_provinces"] = [(p, round(float(a), 2)) for p, a in area_by_province.nlargest(5).items()]
+    
+    # Thống kê theo cây trồng
+    stats["crop_distribution"] = {c: int(n) for c, n in _combine_partials(parts, "crop_counts").items()}
+    
+    # Thống kê năng suất theo tỉnh và cây trồng - chỉ lấy top 3 cho mỗi loại cây
+    grouped = _combine_partials(parts, "crop_province").rename(
+        columns={"area": "total_area", "actual_yield": "total_yield"}
+    )
+    grouped["productivity"] = grouped["total_yield"] / grouped["total_area"]
+    
+    stats["top_provinces_by_crop"] = {}
+    for crop_name, provinces in grouped.groupby(level="crop", sort=False):
+        top = provinces.sort_values("productivity", ascending=False, kind="stable").head(3)
+        stats["top_provinces_by_crop"][crop_name] = [
+            {
+                "province": row.Index[1],
+                "total_area": round(float(row.total_area), 2),
+                "total_yield": round(float(row.total_yield), 2),
+                "productivity": round(float(row.productivity), 2)
+            }
+            for row in top.itertuples()
+        ]
+        log.debug("🌱 %s: %d tỉnh có năng suất", crop_name, len(provinces))
+    
+    log.debug("📊 Tổng số mùa vụ: %d", stats['total_seasons'])
+    log.debug("📊 Số loại cây trồng có năng suất: %d", len(stats["top_provinces_by_crop"]))
+    return stats
+
+def _is_blank(values):
+    """Giá trị thiếu hoặc chuỗi rỗng (Firestore có thể lưu "" thay vì bỏ trống trường)"""
+    return values.isna() | (values.astype(str).str.strip() == "")
+
+def _pending_yield_mask(df):
+    """
+    Các dòng chưa có actual_yield (thiếu, rỗng hoặc 0) nhưng có crop khác rỗng và area > 0 để tự tính
+    """
+    if "crop" not in df or "area" not in df:
+        return pd.Series(False, index=df.index)
+    if "actual_yield" in df:
+        raw_yield = df["actual_yield"]
+        missing_yield = _is_blank(raw_yield) | (pd.to_numeric(raw_yield, errors="coerce") == 0)
+    else:
+        missing_yield = pd.Series(True, index=df.index)
+    area = pd.to_numeric(df["area"], errors="coerce")
+    return missing_yield & ~_is_blank(df["crop"]) & (area > 0)
+
+_seasons_csv_lock = threading.Lock()
+
+def _auto_calculate_csv_yields():
+    """
+    Tính năng suất cho các dòng CSV chưa có actual_yield theo từng chunk, ghi ra file tạm
+    rồi thay file gốc nên bộ nhớ chỉ phụ thuộc kích thước chunk.
+    Đọc dạng chuỗi để các ô không thay đổi được ghi lại nguyên văn.
+    File chỉ được đọc một lượt và ghi một lượt, không phụ thuộc số dòng cần cập nhật.
+    Trả về (số dòng đã tính, thống kê từng phần của dữ liệu sau cập nhật).
+    """
+    with _seasons_csv_lock:
+        return _rewrite_csv_yields()
+
+def _rewrite_csv_yields():
+    columns = None
+    parts = []
+    calculated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # File tạm tên riêng cho mỗi lần ghi: hai process ghi cùng lúc không cắt file của nhau
+    fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, prefix="seasons.", suffix=".csv.tmp")
+    count = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8-sig", newline="") as out:
+            # Tắt nhận diện NA mặc định: ô "NA", "None", "null"... phải được ghi lại nguyên văn
+            reader = pd.read_csv(SEASONS_CSV, dtype=str, keep_default_na=False, chunksize=SEASONS_CHUNK_ROWS)
+            for i, chunk in enumerate(reader):
+                if columns is None:
+                    columns = chunk.columns.tolist() + [c for c in AUTO_YIELD_COLUMNS if c not in chunk]
+                chunk = chunk.reindex(columns=columns).astype({c: object for c in AUTO_YIELD_COLUMNS})
+                mask = _pending_yield_mask(chunk)
+                if mask.any():
+                    yields = pd.Series(
+                        predict_yields(chunk.loc[mask].to_dict("records")), index=chunk.index[mask], dtype=float
+                    ).dropna()
+                    chunk.loc[yields.index, "actual_yield"] = yields.round(2)
+                    chunk.loc[yields.index, "yield_calculated_at"] = calculated_at
+                    chunk.loc[yields.index, "yield_source"] = "auto_overview"
+                    count += len(yields)
+                chunk.to_csv(out, header=(i == 0), index=False)
+                # Ô trống thống kê như NaN, giống lúc quét bằng dtype (nhãn "Chưa xác định")
+                parts.append(_partial_overview_stats(chunk.replace("", np.nan)))
+        if count:
+            os.chmod(tmp_path, os.stat(SEASONS_CSV).st_mode & 0o777)
+            os.replace(tmp_path, SEASONS_CSV)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count, parts
+
+# Bản Parquet (zstd) dựng từ seasons.csv: CSV vẫn là định dạng ghi, Parquet chỉ để đọc nhanh theo cột
+OVERVIEW_PARQUET_COLUMNS = ["crop", "area", "province", "actual_yield"]
+SEASONS_NUMERIC_COLUMNS = ("area", "actual_yield")
+
+def _seasons_csv_stamp():
+    stat = os.stat(SEASONS_CSV)
+    return f"{stat.st_mtime_ns}:{stat.st_size}".encode()
+
+def _seasons_parquet_schema(stamp):
+    """Schema của bản Parquet nếu nó được dựng từ đúng phiên bản CSV hiện tại, ngược lại None"""
+    if pq is None or not os.path.exists(SEASONS_PARQUET):
+        return None
+    try:
+        schema = pq.read_schema(SEASONS_PARQUET)
+    except Exception:
+        return None
+    return schema if (schema.metadata or {}).get(b"source_csv") == stamp else None
+
+def _iter_seasons_parquet(schema):
+    """Đọc bản Parquet theo từng lô, chỉ tải các cột thống kê cần"""
+    columns = [c for c in OVERVIEW_PARQUET_COLUMNS if c in schema.names]
+    parquet_file = pq.ParquetFile(SEASONS_PARQUET, read_dictionary=[c for c in ("crop", "province") if c in columns])
+    for batch in parquet_file.iter_batches(batch_size=SEASONS_CHUNK_ROWS, columns=columns):
+        yield batch.to_pandas()
+
+def _iter_seasons_csv_to_parquet(stamp):
+    """
+    Đọc seasons.csv theo chunk và đồng thời ghi bản Parquet cho các lần đọc sau.
+    Cột số ép về float32 (giá trị lỗi thành NaN), các cột còn lại giữ dạng chuỗi.
+    """
+    header = pd.read_csv(SEASONS_CSV, nrows=0).columns
+    schema = pa.schema(
+        [(c, pa.float32() if c in SEASONS_NUMERIC_COLUMNS else pa.string()) for c in header],
+        metadata={"source_csv": stamp}
+    )
+    fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, prefix="seasons.", suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+            for chunk in pd.read_csv(SEASONS_CSV, dtype=str, chunksize=SEASONS_CHUNK_ROWS):
+                for column in SEASONS_NUMERIC_COLUMNS:
+                    if column in chunk:
+                        chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype("float32")
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                yield chunk
+        os.replace(tmp_path, SEASONS_PARQUET)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _scan_season_frames(frames):
+    parts = []
+    has_pending = False
+    for chunk in frames:
+        parts.append(_partial_overview_stats(chunk))
+        has_pending = has_pending or bool(_pending_yield_mask(chunk).any())
+    return parts, has_pending
+
+def _scan_seasons_csv():
+    try:
+        return _scan_season_frames(pd.read_csv(SEASONS_CSV, dtype=dict(SEASONS_CSV_DTYPES), chunksize=SEASONS_CHUNK_ROWS))
+    except ValueError as e:
+        # Cột số có giá trị nhập tay không hợp lệ: bỏ ép float32, to_numeric sẽ tự loại bỏ
+        log.warning("seasons.csv có giá trị số không hợp lệ (%s), đọc lại không ép kiểu số", e)
+        return _scan_season_frames(
+            pd.read_csv(SEASONS_CSV, dtype=dict(SEASONS_CSV_LABEL_DTYPES), chunksize=SEASONS_CHUNK_ROWS)
+        )
+
+_seasons_parquet_lock = threading.Lock()
+
+def _scan_seasons():
+    """
+    Đọc dữ liệu mùa vụ theo chunk, trả về thống kê từng phần và cờ có dòng cần tính năng suất.
+    Ưu tiên bản Parquet còn mới; nếu CSV đã đổi thì dựng lại Parquet trong cùng lượt đọc.
+    """
+    if pq is None:
+        return _scan_seasons_csv()
+    stamp = _seasons_csv_stamp()
+    schema = _seasons_parquet_schema(stamp)
+    if schema is not None:
+        return _scan_season_frames(_iter_seasons_parquet(schema))
+    if not _seasons_parquet_lock.acquire(blocking=False):
+        # Thread khác đang dựng lại Parquet: lần này đọc thẳng CSV
+        return _scan_seasons_csv()
+    try:
+        with closing(_iter_seasons_csv_to_parquet(stamp)) as frames:
+            return _scan_season_frames(frames)
+    except Exception as e:
+        log.warning("⚠️ Không ghi được file Parquet mùa vụ: %s", e)
+        return _scan_seasons_csv()
+    finally:
+        _seasons_parquet_lock.release()
+
+def _empty_overview_stats():
+    return {
         "total_seasons": 0,
         "total_area": 0,
         "top_provinces": [],
@@ -452,175 +1186,156 @@ def overview():
         "top_provinces_by_crop": {},
         "weather_stats": {}
     }
+
+@cache.memoize(timeout=60)
+def _compute_overview_stats(user):
+    """
+    Đọc mùa vụ, tự động tính năng suất còn thiếu và tổng hợp thống kê cho trang tổng quan.
+    Năng suất vừa tính được đưa thẳng vào thống kê nên trang hiển thị ngay trong cùng request.
+    Trả về None khi không đọc được dữ liệu (None không được cache) để lần sau đọc lại.
+    """
+    stats = _empty_overview_stats()
     
     # ✅ XỬ LÝ DỮ LIỆU MÙA VỤ - TỐI ƯU HÓA
-    seasons_data = []
+    # Thống kê được tổng hợp theo từng phần rồi gộp lại, CSV lớn không cần nằm trọn trong RAM
+    parts = []
+    auto_calculated_count = 0
     
     if config.USE_FIREBASE and db is not None:
+        seasons_data = []
         try:
-            # Lấy tất cả seasons
-            seasons_ref = db.collection("seasons")
-            docs = list(seasons_ref.stream())
-            stats["total_seasons"] = len(docs)
-            
-            for doc in docs:
+            # Lấy tất cả seasons, chỉ tải các trường dùng cho thống kê
+            seasons_ref = db.collection("seasons").select(OVERVIEW_SEASON_FIELDS)
+            for doc in seasons_ref.stream():
                 data = doc.to_dict()
                 data["id"] = doc.id
                 seasons_data.append(data)
                 
         except Exception as e:
-            print("Lỗi đọc thống kê Firestore:", e)
-    else:
-        # CSV fallback - tối ưu hóa
-        SEASONS_CSV_PATH = os.path.join(DATA_DIR, "seasons.csv")
-        if os.path.exists(SEASONS_CSV_PATH):
-            try:
-                df = pd.read_csv(SEASONS_CSV_PATH)
-                stats["total_seasons"] = len(df)
-                seasons_data = df.to_dict(orient="records")
-            except Exception as e:
-                print("Lỗi đọc file CSV mùa vụ:", e)
-    
-    # ✅ TỰ ĐỘNG TÍNH NĂNG SUẤT CHO CÁC MÙA VỤ CHƯA CÓ DỮ LIỆU
-    if seasons_data:
-        auto_calculated_count = 0
-        for season in seasons_data:
-            # Kiểm tra nếu chưa có actual_yield nhưng có đủ thông tin để tính toán
-            if (not season.get("actual_yield") and 
-                season.get("crop") and 
-                season.get("area") and 
-                float(season.get("area", 0)) > 0):
-                
-                predicted_yield = calculate_yield(season)
-                if predicted_yield is not None:
-                    try:
-                        if config.USE_FIREBASE and db is not None:
-                            doc_ref = db.collection("seasons").document(season["id"])
-                            doc_ref.update({
-                                "actual_yield": round(predicted_yield, 2),
-                                "yield_calculated_at": datetime.utcnow().isoformat(),
-                                "yield_source": "auto_overview"
-                            })
-                        else:
-                            # Cập nhật trong CSV
-                            SEASONS_CSV_PATH = os.path.join(DATA_DIR, "seasons.csv")
-                            if os.path.exists(SEASONS_CSV_PATH):
-                                df = pd.read_csv(SEASONS_CSV_PATH)
-                                # Tìm và cập nhật bản ghi
-                                for idx, row in df.iterrows():
-                                    if (str(row.get("farmer_name")) == str(season.get("farmer_name")) and 
-                                        str(row.get("crop")) == str(season.get("crop")) and 
-                                        str(row.get("province")) == str(season.get("province"))):
-                                        df.at[idx, "actual_yield"] = round(predicted_yield, 2)
-                                        df.at[idx, "yield_calculated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                        df.at[idx, "yield_source"] = "auto_overview"
-                                        break
-                                df.to_csv(SEASONS_CSV_PATH, index=False, encoding="utf-8-sig")
-                        
-                        auto_calculated_count += 1
-                        print(f"✅ Đã tự động tính năng suất: {predicted_yield} tấn cho {season.get('crop')} tại {season.get('province')}")
-                        
-                    except Exception as e:
-                        print(f"❌ Lỗi khi lưu năng suất tự động: {e}")
+            log.warning("Lỗi đọc thống kê Firestore: %s", e)
+            return None
         
-        if auto_calculated_count > 0:
-            print(f"📊 Đã tự động tính năng suất cho {auto_calculated_count} mùa vụ")
-            # Load lại trang để hiển thị dữ liệu mới
-            flash(f"✅ Đã tự động tính năng suất cho {auto_calculated_count} mùa vụ", "success")
-            return redirect(url_for("overview"))
-    
-    # ✅ TÍNH TOÁN THỐNG KÊ TỪ DỮ LIỆU MÙA VỤ
-    if seasons_data:
-        area_by_province = {}
-        crop_stats = {}
-        crop_province_stats = {}
-        
-        for season in seasons_data:
-            # Xử lý diện tích
-            try:
-                area = float(season.get("area", 0))
-            except:
-                area = 0
-                
-            province = season.get("province", "Chưa xác định")
-            crop = season.get("crop", "Chưa xác định")
-            
-            # Chuẩn hóa tên cây trồng
-            crop_normalized = crop.strip().lower()
-            
-            # Tổng diện tích
-            stats["total_area"] += area
-            
-            # Thống kê theo tỉnh
-            if province in area_by_province:
-                area_by_province[province] += area
-            else:
-                area_by_province[province] = area
-            
-            # Thống kê theo cây trồng
-            if crop_normalized in crop_stats:
-                crop_stats[crop_normalized] += 1
-            else:
-                crop_stats[crop_normalized] = 1
-            
-            # Thống kê năng suất theo tỉnh và cây trồng
-            # Kiểm tra nếu có actual_yield
-            actual_yield = season.get("actual_yield")
-            if actual_yield and area > 0:
+        if seasons_data:
+            # ✅ TỰ ĐỘNG TÍNH NĂNG SUẤT CHO CÁC MÙA VỤ CHƯA CÓ DỮ LIỆU
+            # Lọc mùa vụ cần tính bằng mask vector hóa (to_numeric) thay vì float() từng dòng
+            seasons_df = pd.DataFrame(seasons_data)
+            pending_positions = np.flatnonzero(_pending_yield_mask(seasons_df).to_numpy())
+            pending = [seasons_data[i] for i in pending_positions]
+            if pending:
+                # Lỗi tải thêm dữ liệu/ghi Firestore chỉ bỏ qua phần tự tính, thống kê vẫn dùng seasons_df đã đọc
                 try:
-                    # Tính năng suất (tấn/ha)
-                    productivity = float(actual_yield) / area
-                    
-                    if crop_normalized not in crop_province_stats:
-                        crop_province_stats[crop_normalized] = []
-                    
-                    # Tìm xem tỉnh đã có trong danh sách chưa
-                    existing_province = None
-                    for item in crop_province_stats[crop_normalized]:
-                        if item["province"] == province:
-                            existing_province = item
-                            break
-                    
-                    if existing_province:
-                        # Cập nhật thông tin nếu đã tồn tại
-                        existing_province["total_area"] += area
-                        existing_province["total_yield"] += float(actual_yield)
-                        existing_province["productivity"] = existing_province["total_yield"] / existing_province["total_area"]
-                    else:
-                        # Thêm tỉnh mới
-                        crop_province_stats[crop_normalized].append({
-                            "province": province,
-                            "total_area": area,
-                            "total_yield": float(actual_yield),
-                            "productivity": productivity
+                    # Tải thêm ngày gieo/thu hoạch và phân bón cho riêng các mùa vụ cần tính
+                    seasons_ref = db.collection("seasons")
+                    pending_refs = [seasons_ref.document(season["id"]) for season in pending]
+                    inputs = {doc.id: doc.to_dict() or {} for doc in db.get_all(pending_refs, field_paths=YIELD_INPUT_FIELDS)}
+                    for season in pending:
+                        season.update(inputs.get(season["id"], {}))
+                    # Gom các cập nhật vào WriteBatch thay vì update từng document,
+                    # đồng thời ghi luôn vào seasons_df để thống kê bên dưới dùng giá trị mới
+                    predicted = {
+                        position: round(predicted_yield, 2)
+                        for position, predicted_yield in zip(pending_positions, predict_yields(pending))
+                        if predicted_yield is not None
+                    }
+                    calculated_at = datetime.utcnow().isoformat()
+                    updates = [
+                        (seasons_data[position]["id"], {
+                            "actual_yield": value,
+                            "yield_calculated_at": calculated_at,
+                            "yield_source": "auto_overview"
                         })
-                except (ValueError, TypeError, ZeroDivisionError) as e:
-                    print(f"Lỗi tính năng suất: {e}")
-                    continue
-        
-        # Sắp xếp và lấy top provinces theo diện tích
-        stats["top_provinces"] = sorted(area_by_province.items(), key=lambda x: x[1], reverse=True)[:5]
-        stats["crop_distribution"] = crop_stats
-        
-        # Xử lý top provinces by crop - chỉ lấy top 3 cho mỗi loại cây
-        stats["top_provinces_by_crop"] = {}
-        for crop, provinces in crop_province_stats.items():
-            if provinces:  # Chỉ xử lý nếu có dữ liệu
-                # Sắp xếp theo năng suất giảm dần và lấy top 3
-                sorted_provinces = sorted(provinces, key=lambda x: x["productivity"], reverse=True)[:3]
-                stats["top_provinces_by_crop"][crop] = sorted_provinces
+                        for position, value in predicted.items()
+                    ]
+                    auto_calculated_count = bulk_update("seasons", updates)
+                    if predicted:
+                        seasons_df["actual_yield"] = pd.to_numeric(
+                            _column_or(seasons_df, "actual_yield", np.nan), errors="coerce"
+                        )
+                        seasons_df.loc[list(predicted), "actual_yield"] = list(predicted.values())
+                except Exception as e:
+                    log.warning("❌ Lỗi khi tự động tính năng suất: %s", e)
+            parts.append(_partial_overview_stats(seasons_df))
+    elif os.path.exists(SEASONS_CSV):
+        # CSV fallback - đọc theo chunk, đồng thời đánh dấu có dòng nào cần tính năng suất
+        has_pending = False
+        try:
+            parts, has_pending = _scan_seasons()
+        except Exception as e:
+            log.warning("Lỗi đọc file CSV mùa vụ: %s", e)
+            return None
         
-        # DEBUG: In ra để kiểm tra
-        print(f"📊 Tổng số mùa vụ: {stats['total_seasons']}")
-        print(f"📊 Số loại cây trồng có năng suất: {len(crop_province_stats)}")
-        for crop, provinces in crop_province_stats.items():
-            print(f"🌱 {crop}: {len(provinces)} tỉnh có năng suất")
+        if has_pending:
+            try:
+                auto_calculated_count, updated_parts = _auto_calculate_csv_yields()
+                if auto_calculated_count > 0:
+                    parts = updated_parts
+            except Exception as e:
+                log.warning("❌ Lỗi khi lưu năng suất tự động: %s", e)
+    
+    if auto_calculated_count > 0:
+        invalidate_season_caches()
+        log.info("📊 Đã tự động tính năng suất cho %d mùa vụ", auto_calculated_count)
+        flash(f"✅ Đã tự động tính năng suất cho {auto_calculated_count} mùa vụ", "success")
+    
+    # ✅ TÍNH TOÁN THỐNG KÊ TỪ DỮ LIỆU MÙA VỤ
+    if parts:
+        _finalize_overview_stats(parts, stats)
     
     # ✅ ĐỌC DỮ LIỆU THỜI TIẾT - TỐI ƯU HÓA
     # ... (phần xử lý thời tiết giữ nguyên)
     
+    return stats
+
+@app.route("/overview")
+@login_required
+def overview():
+    stats = _compute_overview_stats(session['user']) or _empty_overview_stats()
     return render_template("overview.html", stats=stats)
 # ---------- AUTHENTICATION ----------
+# Session HTTP dùng chung cho Firebase Auth: giữ kết nối keep-alive, không bắt tay TLS lại mỗi lần đăng nhập.
+# Retry chỉ áp dụng cho lỗi kết nối (POST không được gửi lại khi server đã nhận request).
+http_client = requests.Session()
+http_client.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.1)
+))
+
+# Bảng user CSV giữ trong bộ nhớ dạng dict username -> row, chỉ đọc lại khi file thay đổi
+# (worker khác ghi file thì mtime đổi nên vẫn thấy user mới)
+_users = {}
+_users_mtime = None
+_users_lock = threading.RLock()
+
+def _get_users():
+    global _users, _users_mtime
+    with _users_lock:
+        if not os.path.exists(USERS_CSV):
+            _users, _users_mtime = {}, None
+            return _users
+        mtime = os.path.getmtime(USERS_CSV)
+        if mtime != _users_mtime:
+            df = pd.read_csv(USERS_CSV, dtype=str)
+            _users = df.drop_duplicates("username").set_index("username").to_dict("index")
+            _users_mtime = mtime
+        return _users
+
+def _save_users(users):
+    global _users, _users_mtime
+    with _users_lock:
+        df = pd.DataFrame.from_dict(users, orient="index").rename_axis("username").reset_index()
+        df.to_csv(USERS_CSV, index=False, encoding="utf-8-sig")
+        _users, _users_mtime = users, os.path.getmtime(USERS_CSV)
+
+def _is_password_hash(stored):
+    return isinstance(stored, str) and stored.startswith(("scrypt:", "pbkdf2:"))
+
+def _verify_password(stored, password):
+    """Kiểm tra mật khẩu với hash scrypt (OpenSSL dùng SHA-NI nếu CPU hỗ trợ), vẫn nhận plaintext cũ trong CSV"""
+    if _is_password_hash(stored):
+        return check_password_hash(stored, password)
+    return isinstance(stored, str) and hmac.compare_digest(stored.encode(), password.encode())
+
 @app.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
@@ -638,30 +1353,27 @@ def register():
                 flash("Lỗi đăng ký Firebase: " + str(e), "danger")
                 return redirect(url_for("register"))
         else:
-            if os.path.exists(USERS_CSV):
-                df = pd.read_csv(USERS_CSV)
-                if username in df['username'].values:
+            with _users_lock:
+                users = _get_users()
+                if username in users:
                     flash("Tên đăng nhập đã tồn tại.", "danger")
                     return redirect(url_for("register"))
-            else:
-                df = pd.DataFrame(columns=["username", "password", "fullname", "role", "created_at"])
-
-            new = pd.DataFrame([{
-                "username": username,
-                "password": password,
-                "fullname": fullname,
-                "role": "user",
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }])
-
-            df = pd.concat([df, new], ignore_index=True)
-            df.to_csv(USERS_CSV, index=False, encoding="utf-8-sig")
+                
+                users = dict(users)
+                users[username] = {
+                    "password": generate_password_hash(password, method="scrypt"),
+                    "fullname": fullname,
+                    "role": "user",
+                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                }
+                _save_users(users)
             flash("Đăng ký thành công (CSV). Vui lòng đăng nhập.", "success")
             return redirect(url_for("login"))
     return render_template("register.html")
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
+    ensure_firestore_warm()
     if request.method == "POST":
         username = request.form.get("username").strip()
         password = request.form.get("password").strip()
@@ -676,10 +1388,12 @@ def login():
             payload = {"email": username, "password": password, "returnSecureToken": True}
 
             try:
-                r = requests.post(url, json=payload, timeout=10)
+                r = http_client.post(url, json=payload, timeout=10)
                 res_json = r.json()
                 if r.status_code == 200:
+                    session.permanent = True
                     session['user'] = username
+                    session['boot'] = BOOT_ID
                     session['idToken'] = res_json.get("idToken")
                     flash("Đăng nhập thành công (Firebase).", "success")
                     return redirect(url_for("index"))
@@ -694,10 +1408,18 @@ def login():
             if not os.path.exists(USERS_CSV):
                 flash("Chưa có người dùng nào. Vui lòng đăng ký.", "warning")
                 return redirect(url_for("register"))
-            df = pd.read_csv(USERS_CSV)
-            user = df[(df['username'] == username) & (df['password'] == password)]
-            if not user.empty:
+            row = _get_users().get(username)
+            stored = row.get('password') if row else None
+            if stored is not None and _verify_password(stored, password):
+                # Tài khoản cũ lưu plaintext: băm lại ngay khi đăng nhập thành công
+                if not _is_password_hash(stored):
+                    with _users_lock:
+                        users = dict(_get_users())
+                        users[username] = {**users[username], "password": generate_password_hash(password, method="scrypt")}
+                        _save_users(users)
+                session.permanent = True
                 session['user'] = username
+                session['boot'] = BOOT_ID
                 flash(f"Chào mừng {username}", "success")
                 return redirect(url_for("index"))
             else: